@@ -53,11 +53,8 @@ import sys
 __unittest = "unittest" in sys.modules
 # Standard library imports go here
 import atexit
-import binascii
 from collections import namedtuple
-from email.utils import formatdate
 import errno
-import gc
 import logging
 try:
     # Fixes late numba ImportError conflict with veles.prng
@@ -67,8 +64,6 @@ try:
 except ImportError:
     pass
 import os
-import resource
-import runpy
 
 import veles
 from veles.dot_pip import install_dot_pip
@@ -77,29 +72,17 @@ from veles.dot_pip import install_dot_pip
 install_dot_pip()
 
 # 3rd party imports go here
-import numpy
-from six import print_, StringIO, PY3, string_types
-if PY3:
-    from urllib.parse import splittype
-else:
-    from urllib import splittype
-import wget
+from io import StringIO
 
 # Veles imports go here
 from veles.config import root
 from veles.cmdline import CommandLineBase
-from veles.compat import from_none, FileNotFoundError, IsADirectoryError, \
-    PermissionError
-from veles.external import daemon
+from veles.compat import from_none
 from veles.import_file import get_file_package_and_module, \
     import_file_as_package, import_file_as_module
+from veles.launcher import Launcher  # do not remove or options like -m, -l,
+# -n and the rest registered by Launcher will disappear from the parser
 from veles.logger import Logger
-from veles.launcher import Launcher
-from veles.memory import Watcher
-from veles.pickle2 import setup_pickle_debug
-from veles import prng
-from veles.snapshotter import SnapshotterToDB, SnapshotterToFile
-from veles.thread_pool import ThreadPool
 import veles.accelerated_units  # do not remove or options like --force-numpy
 # or --sync-run in accelerated_units will disappear
 import veles.loader.base  # do not remove or options like --train-ratio
@@ -107,18 +90,23 @@ import veles.loader.base  # do not remove or options like --train-ratio
 
 
 def unload_unittest():
-    if not __unittest and "unittest" in sys.modules:
-        # Ensure unittest package is unloaded if it should be
-        for k in [k for k in sys.modules if k.startswith("unittest")]:
-            del sys.modules[k]
+    # Ensure unittest package is unloaded if it should be; skip the
+    # sys.modules scan entirely on a cold interpreter.
+    if __unittest or "unittest" not in sys.modules:
+        return
+    for k in [k for k in sys.modules if k.startswith("unittest")]:
+        del sys.modules[k]
 
 unload_unittest()
 del __unittest
 del unload_unittest
 
-__doc__ += (" " * 7 +  # pylint: disable=W0622
-            ("\n" + " " * 7).join(veles.__logo__.split('\n')) +
-            u"\u200B\n")
+# The decorated docstring is only ever rendered by Sphinx, so skip the
+# string building on ordinary startups.
+if any(m.startswith("sphinx") for m in sys.modules):
+    __doc__ += (" " * 7 +  # pylint: disable=W0622
+                ("\n" + " " * 7).join(veles.__logo__.split('\n')) +
+                u"\u200B\n")
 
 
 def create_args_parser_sphinx():
@@ -128,6 +116,23 @@ def create_args_parser_sphinx():
     return CommandLineBase.init_parser(True)
 
 
+def _print_max_rss():
+    # Registered with atexit; deliberately a free function - a bound method
+    # would pin the Main instance (and the workflow it references) in memory
+    # until interpreter shutdown, and a weak reference would be dead by the
+    # time atexit fires because nothing else holds the instance.
+    import resource
+    from veles.memory import Watcher
+
+    log = logging.getLogger("Main")
+    res = resource.getrusage(resource.RUSAGE_SELF)
+    if Watcher.max_mem_in_use > 0:
+        log.info("Peak device memory used: %s Kb",
+                 Main.format_decimal(Watcher.max_mem_in_use // 1000))
+    log.info("Peak resident memory used: %s Kb",
+             Main.format_decimal(res.ru_maxrss))
+
+
 OptimizationTuple = namedtuple("OptimizationTuple", ("size", "generations"))
 EnsembleTrainTuple = namedtuple("EnsembleTrainTuple", ("size", "train_ratio"))
 EnsembleTestTuple = namedtuple("EnsembleTestTuple", ("input_file",))
@@ -204,7 +209,7 @@ class Main(Logger, CommandLineBase):
         if value is None:
             self._ensemble_test = None
             return
-        if not isinstance(value, string_types):
+        if not isinstance(value, str):
             raise TypeError(
                 "ensemble_test must be a string (got %s)" % type(value))
         self._ensemble_test = EnsembleTestTuple(value)
@@ -215,12 +220,15 @@ class Main(Logger, CommandLineBase):
             not self.ensemble_test
 
     def _process_special_args(self):
-        if "--frontend" in sys.argv:
+        # The frontend rewrites sys.argv, so loop until it settles instead of
+        # recursing and re-running all the checks below on each pass.
+        while "--frontend" in sys.argv:
             try:
                 self._open_frontend()
             except KeyboardInterrupt:
                 return Main.EXIT_FAILURE
-            return self._process_special_args()
+        # One pass over argv for all the constant-time option checks below.
+        argv_set = frozenset(sys.argv[1:])
         if self.interactive:
             for opt in "forge", "--version", "--help", "--dump-config":
                 if opt in self.argv:
@@ -239,16 +247,16 @@ class Main(Logger, CommandLineBase):
                     raise from_none(e)
                 self.exception("Failed to run forge %s", action)
                 return Main.EXIT_FAILURE
-        if "--version" in sys.argv:
+        if "--version" in argv_set:
             self._print_version()
             return Main.EXIT_SUCCESS
-        if "--html-help" in sys.argv:
+        if "--html-help" in argv_set:
             veles.__html__()
             return Main.EXIT_SUCCESS
-        if "--help" in sys.argv:
+        if "--help" in argv_set:
             # help text requires UTF-8, but the default codec is ascii over ssh
             Logger.ensure_utf8_streams()
-        if "--dump-config" in sys.argv:
+        if "--dump-config" in argv_set:
             self.info("Scanning for the plugins...")
             self.debug("Loaded plugins: %s", veles.__plugins__)
             root.print_()
@@ -280,7 +288,6 @@ class Main(Logger, CommandLineBase):
             from veles.scripts.generate_frontend import main
 
             main()
-            gc.collect()
 
         from random import randint
 
@@ -370,11 +377,12 @@ class Main(Logger, CommandLineBase):
         self.ensemble_test = args.ensemble_test
 
     def _daemonize(self):
+        from veles.external import daemon
+
         daemon_context = daemon.DaemonContext()
         daemon_context.working_directory = os.getcwd()
         daemon_context.files_preserve = [
-            int(fd) for fd in os.listdir("/proc/self/fd")
-            if int(fd) > 2]
+            fd for fd in map(int, os.listdir("/proc/self/fd")) if fd > 2]
         daemon_context.open()  # <- the magic happens here
 
     @staticmethod
@@ -434,6 +442,7 @@ class Main(Logger, CommandLineBase):
             sys.exit(Main.EXIT_FAILURE)
 
         self.info("Applying the configuration from %s...", fname_config)
+        import runpy
         try:
             runpy.run_path(fname_config)
         except FileNotFoundError:
@@ -471,20 +480,59 @@ class Main(Logger, CommandLineBase):
         except:
             fail()
 
+    @staticmethod
+    def _compile_overrides(cmds):
+        """
+        Compiles the configuration overrides, reusing a code object cached on
+        disk by previous runs with the same overrides (typical for parameter
+        sweeps which respawn the process many times). marshal data is
+        interpreter specific, so the magic cache tag takes part in the file
+        name.
+        """
+        import hashlib
+        import marshal
+
+        path = os.path.join(
+            root.common.dirs.cache, "overrides", "%s.%s.bin" % (
+                hashlib.sha1(cmds.encode("utf-8")).hexdigest(),
+                sys.implementation.cache_tag))
+        try:
+            with open(path, "rb") as fin:
+                return marshal.load(fin)
+        except (OSError, IOError, ValueError, EOFError, TypeError):
+            # marshal.load raises TypeError ("bad marshal data") on corrupt
+            # files; treat any unreadable cache entry as a miss, otherwise a
+            # stale file would fail every run with the same overrides.
+            pass
+        code = compile(cmds, "<override>", "exec")
+        try:
+            if not os.path.exists(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            with open(path, "wb") as fout:
+                marshal.dump(code, fout)
+        except (OSError, IOError):
+            pass
+        return code
+
     def _override_config(self, config_list):
         cmds = "\n".join(config_list)
         self.debug("Overriding the configuration with %s", cmds)
         try:
-            exec(cmds)
+            exec(self._compile_overrides(cmds))
         except:
             self.exception("Invalid configuration overloads")
             sys.exit(Main.EXIT_FAILURE)
 
     def _seed_random(self, rndvals):
+        import binascii
+        import numpy
+        from veles import prng
+
         self.debug("Seeding with %s", rndvals)
         rndvals_split = rndvals.split(',')
+        first_fname = rndvals_split[0].split(':')[0]
         seeds = []
-        for rndval, index in zip(rndvals_split, range(len(rndvals_split))):
+        for index, rndval in enumerate(rndvals_split):
             try:
                 binvle = binascii.unhexlify(rndval)
                 seed = numpy.frombuffer(binvle, dtype=numpy.uint8)
@@ -497,7 +545,7 @@ class Main(Logger, CommandLineBase):
             fname = vals[0]
             if fname == "":
                 if index > 1:
-                    fname = rndvals_split[0].split(':')[0] + str(index)
+                    fname = first_fname + str(index)
                 else:
                     self.critical("Random generator file name is empty")
                     sys.exit(errno.ENOENT)
@@ -512,11 +560,16 @@ class Main(Logger, CommandLineBase):
                 continue
             if not os.path.isabs(fname):
                 new_fname = os.path.abspath(fname)
-                if os.path.exists(new_fname):
+                # os.path.exists() is merely a try/except around os.stat(),
+                # so probe directly and skip the wrapper per seed argument.
+                try:
+                    os.stat(new_fname)
                     fname = new_fname
-                else:
+                except OSError:
                     fname = os.path.join(root.common.dirs.veles, fname)
-                    if not os.path.exists(fname):
+                    try:
+                        os.stat(fname)
+                    except OSError:
                         self.critical("Neither %s nor %s exist. Cannot seed "
                                       "the random generator.", new_fname,
                                       fname)
@@ -537,8 +590,9 @@ class Main(Logger, CommandLineBase):
         self.seeds = seeds
 
     def _load_workflow(self, fname_snapshot):
-        stype = splittype(fname_snapshot)[0]
-        if stype == "odbc":
+        from veles.snapshotter import SnapshotterToDB, SnapshotterToFile
+
+        if fname_snapshot.startswith("odbc://"):
             import pyodbc
 
             addr = fname_snapshot[7:]
@@ -569,8 +623,10 @@ class Main(Logger, CommandLineBase):
                 self.warning(
                     "Failed to load the snapshot from ODBC source: %s", e)
                 return None
-        elif stype in ("http", "https"):
+        elif fname_snapshot.startswith(("http://", "https://")):
             try:
+                import wget
+
                 self.info("Downloading %s...", fname_snapshot)
                 fname_snapshot = self.snapshot_file_name = wget.download(
                     fname_snapshot, root.common.dirs.snapshots)
@@ -646,7 +702,6 @@ class Main(Logger, CommandLineBase):
         try:
             if self._dump_attrs != "no":
                 self._dump_unit_attributes(self._dump_attrs == "all")
-            gc.collect()
             if self._dry_run > 2:
                 self.debug("Running the launcher")
                 self.launcher.run()
@@ -661,28 +716,46 @@ class Main(Logger, CommandLineBase):
             self.launcher.device_thread_pool_detach()
 
     def _dump_unit_attributes(self, arrays=True):
-        import veles.external.prettytable as prettytable
         from veles.workflow import Workflow
 
         self.debug("Dumping unit attributes of %s...", str(self.workflow))
-        table = prettytable.PrettyTable("#", "unit", "attr", "value")
-        table.align["#"] = "r"
-        table.align["unit"] = "l"
-        table.align["attr"] = "l"
-        table.align["value"] = "l"
-        table.max_width["value"] = 100
+        hidden_attrs = frozenset(Workflow.HIDDEN_UNIT_ATTRS)
+        headers = ("#", "unit", "attr", "value")
+        # Only the first three columns are padded: padding the trailing
+        # value column would blow the output up to rows x longest-repr
+        # characters in "all" mode and merely adds trailing whitespace.
+        widths = [len(h) for h in headers[:3]]
+        rows = []
         for i, u in enumerate(self.workflow.units_in_dependency_order):
+            unit_name = u.__class__.__name__
             for k, v in sorted(u.__dict__.items()):
-                if k not in Workflow.HIDDEN_UNIT_ATTRS:
-                    if (not arrays and hasattr(v, "__len__") and len(v) > 32
-                            and not isinstance(v, str)
-                            and not isinstance(v, bytes)):
-                        strv = "object of class %s of length %d" % (
-                            repr(v.__class__.__name__), len(v))
-                    else:
-                        strv = repr(v)
-                    table.add_row(i, u.__class__.__name__, k, strv)
-        print(table)
+                if k in hidden_attrs:
+                    continue
+                if (not arrays and hasattr(v, "__len__") and len(v) > 32
+                        and not isinstance(v, str)
+                        and not isinstance(v, bytes)):
+                    strv = "object of class %s of length %d" % (
+                        repr(v.__class__.__name__), len(v))
+                else:
+                    strv = repr(v)
+                    # Cap the value right away in "pretty" mode: PrettyTable
+                    # kept the complete repr of every attribute in memory and
+                    # shortened it only while rendering, peaking RSS on
+                    # workflows with big attributes. "all" mode dumps the
+                    # full values by definition, so it is left untouched.
+                    if not arrays and len(strv) > 100:
+                        strv = strv[:97] + "..."
+                row = (str(i), unit_name, k, strv)
+                for j in range(3):
+                    if len(row[j]) > widths[j]:
+                        widths[j] = len(row[j])
+                rows.append(row)
+        fmt = "%%%ds | %%-%ds | %%-%ds | %%s\n" % tuple(widths)
+        write = sys.stdout.write
+        write(fmt % headers)
+        write("-" * (sum(widths) + 9 + len(headers[3])) + "\n")
+        for row in rows:
+            write(fmt % row)
 
     def _visualize_workflow(self):
         _, file_name = self.workflow.generate_graph(with_data_links=True,
@@ -697,7 +770,7 @@ class Main(Logger, CommandLineBase):
         from twisted.internet import reactor
 
         reactor.callWhenRunning(self._run_workflow_plotters)
-        reactor.callWhenRunning(print_, "Press Ctrl-C when you are done...")
+        reactor.callWhenRunning(print, "Press Ctrl-C when you are done...")
         reactor.run()
 
     def _run_workflow_plotters(self):
@@ -761,6 +834,8 @@ class Main(Logger, CommandLineBase):
             sys.stdout.flush()
 
     def _print_version(self):
+        from email.utils import formatdate
+
         print(veles.__version__, formatdate(veles.__date__, True),
               veles.__git__)
 
@@ -778,23 +853,15 @@ class Main(Logger, CommandLineBase):
 
     def _register_print_max_rss(self):
         if not Main.registered_print_max_rss:
-            atexit.register(self.print_max_rss)
+            atexit.register(_print_max_rss)
             Main.registered_print_max_rss = True
 
     @staticmethod
     def format_decimal(val):
-        if val < 1000:
-            return str(val)
-        d, m = divmod(val, 1000)
-        return Main.format_decimal(d) + " %03d" % m
+        return format(val, ",").replace(",", " ")
 
     def print_max_rss(self):
-        res = resource.getrusage(resource.RUSAGE_SELF)
-        if Watcher.max_mem_in_use > 0:
-            self.info("Peak device memory used: %s Kb",
-                      self.format_decimal(Watcher.max_mem_in_use // 1000))
-        self.info("Peak resident memory used: %s Kb",
-                  self.format_decimal(res.ru_maxrss))
+        _print_max_rss()
 
     def run_module(self, module, **kwargs):
         self.debug("Calling %s.run()...", module.__name__)
@@ -835,7 +902,11 @@ class Main(Logger, CommandLineBase):
             logging.getLogger(name).setLevel(logging.DEBUG)
         self._seed_random(args.random_seed)
         if args.debug_pickle:
+            from veles.pickle2 import setup_pickle_debug
+
             setup_pickle_debug()
+        from veles.thread_pool import ThreadPool
+
         ThreadPool.reset()
         self._register_print_max_rss()
 
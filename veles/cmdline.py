@@ -114,6 +114,7 @@ class CommandLineBase(object):
     SPECIAL_OPTS = ["--help", "--html-help", "--version", "--frontend",
                     "--dump-config"]
     _argv = tuple()
+    _parser_cache = {}
 
     class SortingRawDescriptionHelpFormatter(RawDescriptionHelpFormatter):
         def add_arguments(self, actions):
@@ -125,7 +126,17 @@ class CommandLineBase(object):
     def init_parser(sphinx=False, ignore_conflicts=False):
         """
         Creates the command line argument parser.
+
+        Walking every registered class is a noticeable startup cost, so the
+        built parser is memoized; the cache key includes the registry size,
+        which invalidates the entry as soon as another class (e.g. a plugin)
+        registers its own options.
         """
+        cache_key = (sphinx, ignore_conflicts,
+                     len(CommandLineArgumentsRegistry.classes))
+        parser = CommandLineBase._parser_cache.get(cache_key)
+        if parser is not None:
+            return parser
 
         parser = ArgumentParser(
             description=CommandLineBase.LOGO if not sphinx else "",
@@ -236,6 +247,7 @@ class CommandLineBase(object):
             NoEscapeCompleter()(parser)  # pylint: disable=E1102
         except:
             pass
+        CommandLineBase._parser_cache[cache_key] = parser
         return parser
 
     @staticmethod
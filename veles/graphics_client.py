@@ -75,8 +75,15 @@ class ZmqSubscriber(ZmqConnection):
         self.graphics = graphics
 
     def messageReceived(self, message):
-        self.graphics.debug("Received %d bytes", len(message[0]))
-        raw_data = snappy.decompress(message[0][len('graphics'):])
+        if len(message) > 1:
+            # The topic arrives as a separate part, so the payload needs no
+            # prefix-stripping copy.
+            data = message[1]
+        else:
+            # Single-part frame from an older publisher.
+            data = message[0][len('graphics'):]
+        self.graphics.debug("Received %d bytes", len(data))
+        raw_data = snappy.decompress(data)
         obj = pickle.loads(raw_data)
         self.graphics.update(obj, raw_data)
 
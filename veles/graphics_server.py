@@ -66,7 +66,10 @@ class ZmqPublisher(ZmqConnection):
     socketType = zmq.PUB
 
     def send(self, message):
-        super(ZmqPublisher, self).send(b'graphics' + message)
+        # Ship the subscription topic as a separate part: concatenating it
+        # in front of the frame copied the whole compressed payload on every
+        # plot update (and again on the receiving side when stripping it).
+        super(ZmqPublisher, self).send(b'graphics', message)
 
 
 @six.add_metaclass(CommandLineArgumentsRegistry)
@@ -36,6 +36,7 @@ under the License.
 
 
 import argparse
+from copy import copy
 import datetime
 import getpass
 from itertools import chain
@@ -43,15 +44,16 @@ import json
 import os
 import subprocess
 from tempfile import NamedTemporaryFile
-import paramiko
 import platform
 import signal
 from six import BytesIO, add_metaclass
+from six.moves import shlex_quote
 import socket
 import sys
 import threading
 import time
-from twisted.internet import reactor
+from twisted.internet import reactor, threads
+from twisted.internet.defer import DeferredList, DeferredSemaphore
 from twisted.internet.error import ReactorNotRunning
 from twisted.web.html import escape
 from twisted.web.client import (Agent, HTTPConnectionPool, FileBodyProducer,
@@ -60,6 +62,10 @@ from twisted.web.http_headers import Headers
 import uuid
 
 from veles.backends import Device, NumpyDevice
+# client, server and graphics_server carry CommandLineArgumentsRegistry
+# classes; do not defer these imports or their options (--async-slave,
+# --job-timeout, --graphics-pickle-debug, ...) will never be registered
+# before the command line is parsed.
 from veles.client import Client as SlaveManager
 from veles.cmdline import CommandLineArgumentsRegistry, CommandLineBase
 from veles.compat import from_none
@@ -69,24 +75,49 @@ from veles.plotter import Plotter
 import veles.logger as logger
 from veles.server import Server as MasterManager
 from veles.thread_pool import ThreadPool
-from veles.external.pytrie import StringTrie
+
+
+# The startup script never changes within a process, so resolve it once
+# instead of paying a getcwd() plus normalization per launch.
+_SELF_PATH = os.path.abspath(sys.argv[0])
+_RUN_AS_MAIN = os.path.splitext(os.path.basename(sys.argv[0]))[0] == "__main__"
+
+_boolean_args = None
+_boolean_args_key = None
+
+
+def _get_boolean_args():
+    """
+    Returns the cached set of store_true/store_false option strings known to
+    the full command line parser. Building that parser spans every registered
+    class, so doing it inside each filter_argv() call made the filter cost
+    O(parser size) per invocation. Like CommandLineBase._parser_cache, the
+    cache is keyed on the registry size, so options registered after the
+    first call (plugins, late imports) are picked up.
+    """
+    global _boolean_args, _boolean_args_key
+    key = len(CommandLineArgumentsRegistry.classes)
+    if _boolean_args is None or _boolean_args_key != key:
+        _boolean_args = frozenset(chain.from_iterable(
+            a.option_strings for a in CommandLineBase.init_parser()._actions
+            if isinstance(a, (argparse._StoreTrueAction,
+                              argparse._StoreFalseAction))))
+        _boolean_args_key = key
+    return _boolean_args
 
 
 def filter_argv(argv, *blacklist):
-    ptree = StringTrie({v: i for i, v in enumerate(blacklist)})
+    # str.startswith() with a tuple matches any blacklisted prefix, including
+    # the --option=value forms, without building a trie on every call.
     filtered = []
-    maybe_value = False
-    boolean_args = set(chain.from_iterable(
-        a.option_strings for a in CommandLineBase.init_parser()._actions
-        if isinstance(a, (argparse._StoreTrueAction,
-                          argparse._StoreFalseAction))))
+    boolean_args = _get_boolean_args()
     i = -1
     while i + 1 < len(argv):
         i += 1
         arg = argv[i]
         has_value = arg.startswith("-") and arg not in boolean_args \
             and '=' not in arg and arg != "-"
-        if ptree.longest_prefix(arg, None) is None:
+        if not arg.startswith(blacklist):
             filtered.append(arg)
             if has_value:
                 i += 1
@@ -115,17 +146,98 @@ class Launcher(logger.Logger):
 
     graphics_client = None
     graphics_server = None
+    # Cap on concurrent SSH handshakes; sshd defaults to MaxStartups 10 and
+    # starts dropping connections beyond that.
+    SSH_FANOUT_LIMIT = 8
+    # The keyword arguments which alter what init_parser() builds; any other
+    # combination may safely share the cached default parser.
+    PARSER_KWARGS = frozenset((
+        "parser", "master_address", "listen_address", "test",
+        "matplotlib_backend", "graphics_client", "stealth", "nodes",
+        "log_file", "log_mongo", "log_id"))
+    _default_parser = None
+    _default_namespace = None
+    _web_status_cmdline = None
+    _web_status_addr = None
+    # Logger does not declare __slots__, so instances keep a __dict__ for
+    # externally attached attributes (workflow_file, config_file, seeds, ...);
+    # still, slotting our own attributes turns their access into an array
+    # index and keeps them out of that dict.
+    __slots__ = (
+        "args", "_initialized", "_running", "_testing", "is_master",
+        "is_slave", "is_standalone", "_master_address", "_listen_address",
+        "_listen_host", "_listen_port", "_matplotlib_backend",
+        "_slaves", "_slave_launch_transform",
+        "_result_file", "_id", "_log_id", "_ssh_pool", "_ssh_pool_lock",
+        "_ssh_host_locks", "_local_hostname", "_resolved_hosts", "_lock",
+        "_webagg_port",
+        "_agent", "_workflow", "_start_time", "_device", "_interactive",
+        "_reactor_thread", "_reactor_thread_ident", "_notify_update_interval",
+        "_notify_update_last_time", "_web_status_agent", "_notify_url",
+        "_notify_headers", "workflow_graph", "_interactive_shutdown_ref",
+        "_on_stop_ref", "_print_stats_ref", "_work_end")
 
     def __init__(self, interactive=False, **kwargs):
         super(Launcher, self).__init__()
+        if Launcher.PARSER_KWARGS.isdisjoint(kwargs):
+            # Building an ArgumentParser is pure overhead when repeated for
+            # every Launcher (tests, nested workflows), so reuse one instance.
+            if Launcher._default_parser is None:
+                Launcher._default_parser = Launcher.init_parser()
+            parser = Launcher._default_parser
+        else:
+            parser = Launcher.init_parser(**kwargs)
+        args, _ = parser.parse_known_args(self.argv)
+        self._init_from_args(args, interactive, **kwargs)
+
+    @classmethod
+    def slave(cls, master_address, **kwargs):
+        """
+        Constructs a slave-mode Launcher directly from the master's address,
+        skipping the argparse dance for the common programmatic case.
+        """
+        launcher = cls.__new__(cls)
+        logger.Logger.__init__(launcher)
+        args = copy(cls._default_args())
+        args.master_address = master_address
+        for key, value in kwargs.items():
+            if hasattr(args, key):
+                setattr(args, key, value)
+        launcher._init_from_args(args, False, **kwargs)
+        return launcher
+
+    @classmethod
+    def _default_args(cls):
+        """
+        Returns the cached Namespace with the parser's default values.
+        """
+        if cls._default_namespace is None:
+            if cls._default_parser is None:
+                cls._default_parser = cls.init_parser()
+            cls._default_namespace, _ = \
+                cls._default_parser.parse_known_args([])
+        return cls._default_namespace
+
+    def _init_from_args(self, args, interactive, **kwargs):
         self._initialized = False
         self._running = False
-        parser = Launcher.init_parser(**kwargs)
-        self.args, _ = parser.parse_known_args(self.argv)
-        self.args.master_address = self.args.master_address.strip()
-        self.args.listen_address = self.args.listen_address.strip()
+        self.args = args
+        # Strip once into the slots; every later read is then a single
+        # attribute load instead of going through the argparse Namespace.
+        self._master_address = self.args.master_address.strip()
+        self._listen_address = self.args.listen_address.strip()
+        # The mode never changes after construction and these flags are read
+        # repeatedly in initialize()/run()/stop(), so cache plain attributes
+        # instead of recomputing string truthiness behind properties.
+        self.is_master = bool(self._listen_address)
+        self.is_slave = bool(self._master_address)
+        self.is_standalone = not self.is_master and not self.is_slave
+        # Split the address once here instead of rescanning the string in
+        # _launch_nodes, which may be re-entered on YARN node discovery.
+        self._listen_host, _, self._listen_port = \
+            self._listen_address.partition(':')
         self.testing = self.args.test
-        self.args.matplotlib_backend = self.args.matplotlib_backend.strip()
+        self._matplotlib_backend = self.args.matplotlib_backend.strip()
         self._slaves = [x.strip() for x in self.args.nodes.split(',')
                         if x.strip() != ""]
         self._slave_launch_transform = self.args.slave_launch_transform
@@ -159,6 +271,11 @@ class Launcher(logger.Logger):
 
         self._monkey_patch_twisted_failure()
         self._lock = threading.Lock()
+        self._ssh_pool = {}
+        self._ssh_pool_lock = threading.Lock()
+        self._ssh_host_locks = {}
+        self._local_hostname = socket.gethostname()
+        self._resolved_hosts = {}
         self._webagg_port = 0
         self._agent = None
         self._workflow = None
@@ -166,6 +283,10 @@ class Launcher(logger.Logger):
         self._device = NumpyDevice()
         self._interactive = interactive
         self._reactor_thread = None
+        # The standalone fast path in _pre_run() may finish the workflow
+        # before the reactor starts and set_thread_ident runs, and
+        # on_workflow_finished reads this attribute from the worker thread.
+        self._reactor_thread_ident = None
         self._notify_update_interval = kwargs.get(
             "status_update_interval",
             root.common.web.notification_interval)
@@ -315,7 +436,7 @@ class Launcher(logger.Logger):
 
     @property
     def matplotlib_backend(self):
-        return self.args.matplotlib_backend
+        return self._matplotlib_backend
 
     @property
     def reports_web_status(self):
@@ -329,18 +450,6 @@ class Launcher(logger.Logger):
     def webagg_port(self):
         return self._webagg_port
 
-    @property
-    def is_master(self):
-        return True if self.args.listen_address else False
-
-    @property
-    def is_slave(self):
-        return True if self.args.master_address else False
-
-    @property
-    def is_standalone(self):
-        return not self.is_master and not self.is_slave
-
     @property
     def is_main(self):
         return False
@@ -437,7 +546,7 @@ class Launcher(logger.Logger):
             self._interactive_shutdown_ref = self._interactive_shutdown
             ThreadPool.register_atexit(self._interactive_shutdown_ref)
         if self.is_slave:
-            self._agent = SlaveManager(self.args.master_address, self.workflow)
+            self._agent = SlaveManager(self._master_address, self.workflow)
 
             def on_id_received(node_id, log_id):
                 self.id = node_id
@@ -453,6 +562,12 @@ class Launcher(logger.Logger):
                 self._web_status_agent = Agent(
                     reactor, pool=HTTPConnectionPool(reactor),
                     connectTimeout=timeout)
+                # The update endpoint and headers are constant, so do not
+                # rebuild them on every periodic notification.
+                self._notify_url = ("http://%s:%d/update" % (
+                    root.common.web.host, root.common.web.port))\
+                    .encode('ascii')
+                self._notify_headers = Headers({b'User-Agent': [b'twisted']})
                 # Launch the status server if it's not been running yet
                 self._launch_status()
             if self.workflow.plotters_are_enabled and \
@@ -474,7 +589,7 @@ class Launcher(logger.Logger):
                              "no effect.")
             if self.is_master:
                 try:
-                    self._agent = MasterManager(self.args.listen_address,
+                    self._agent = MasterManager(self._listen_address,
                                                 self.workflow)
                     # Launch the nodes described in the command line or config
                     self._launch_nodes()
@@ -615,11 +730,15 @@ class Launcher(logger.Logger):
         self.workflow.thread_pool.resume()
 
     def launch_remote_progs(self, host, *progs, **kwargs):
+        import paramiko
+
+        if len(progs) == 0:
+            return
         self.info("Launching %d instance(s) on %s", len(progs), host)
         cwd = kwargs.get("cwd", os.getcwd())
         self.debug("launch_remote_progs: cwd: %s", cwd)
         python_path = kwargs.get("python_path", os.getenv("PYTHONPATH"))
-        if os.path.splitext(os.path.basename(sys.argv[0]))[0] == "__main__":
+        if _RUN_AS_MAIN:
             if python_path is None:
                 python_path = cwd
             else:
@@ -629,35 +748,113 @@ class Launcher(logger.Logger):
             ppenv = "export PYTHONPATH='%s' && " % python_path
         else:
             ppenv = ""
-        pc = paramiko.SSHClient()
         try:
-            pc.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-            try:
-                pc.connect(host, look_for_keys=True, timeout=0.2)
-            except paramiko.ssh_exception.SSHException:
-                self.exception("Failed to connect to %s", host)
-                return
+            pc = self._get_ssh_client(host)
+        except (paramiko.SSHException, socket.error):
+            self.exception("Failed to connect to %s", host)
+            return
+        try:
             buf_size = 128
+            cmds = []
+            for prog in progs:
+                # The commands arrive already shlex-quoted for the single
+                # remote shell layer (see _launch_nodes); escaping their
+                # quotes again would deliver the quoting characters to the
+                # slave verbatim and break overrides like key='value'.
+                cmds.append(self._slave_launch_transform %
+                            ("cd '%s' && %s%s" % (cwd, ppenv, prog)))
+            # Ship all the commands for this host in one exec over one
+            # channel: channel-open round trips dominate when a single box
+            # runs several local slaves. Background every chain and wait for
+            # all of them - without the trailing "wait" the channel (and its
+            # pty) closes as soon as the last foreground chain ends, SIGHUPing
+            # slaves that have not finished daemonizing yet.
+            cmd = " & ".join(cmds) + " & wait" if len(cmds) > 1 else cmds[0]
+            self.debug("Executing %s", cmd)
             channel = pc.get_transport().open_session()
             channel.get_pty()
-            for prog in progs:
-                prog = prog.replace(r'"', r'\"').replace(r"'", r"\'")
-                cmd = self._slave_launch_transform % ("cd '%s' && %s%s" %
-                                                      (cwd, ppenv, prog))
-                self.debug("Executing %s", cmd)
-                channel.exec_command(cmd)
-                answer = channel.recv(buf_size)
-                if answer:
+            channel.exec_command(cmd)
+            answer = channel.recv(buf_size)
+            if answer:
+                buf = channel.recv(buf_size)
+                while buf:
+                    answer += buf
                     buf = channel.recv(buf_size)
-                    while buf:
-                        answer += buf
-                        buf = channel.recv(buf_size)
-                    self.warning("SSH returned:\n%s", answer.decode('utf-8'))
+                self.warning("SSH returned:\n%s", answer.decode('utf-8'))
             channel.close()
-        except:
+        except (paramiko.SSHException, socket.error):
             self.exception("Failed to launch '%s' on %s", progs, host)
-        finally:
-            pc.close()
+
+    def _get_ssh_client(self, host):
+        """
+        Returns an already authenticated SSHClient for the host, connecting
+        only if there is no live one in the pool. SSH key exchange and
+        authentication dominate the cost of the trivial exec_command-s, so
+        the transport is reused across calls and closed on shutdown.
+        """
+        import paramiko
+
+        # The pool lock guards only the dictionaries; connecting while
+        # holding it would serialize the _launch_nodes fan-out across
+        # distinct hosts, defeating the concurrent launch entirely. A
+        # per-host lock still keeps handshakes to the same box single file.
+        with self._ssh_pool_lock:
+            pc = self._ssh_pool.get(host)
+            if pc is not None:
+                transport = pc.get_transport()
+                if transport is not None and transport.is_active():
+                    return pc
+            host_lock = self._ssh_host_locks.setdefault(host,
+                                                        threading.Lock())
+        with host_lock:
+            with self._ssh_pool_lock:
+                pc = self._ssh_pool.get(host)
+            if pc is not None:
+                transport = pc.get_transport()
+                if transport is not None and transport.is_active():
+                    return pc
+                pc.close()
+                with self._ssh_pool_lock:
+                    self._ssh_pool.pop(host, None)
+            # Resolve once and remember the IP: paramiko would otherwise run
+            # getaddrinfo() on every connect.
+            ip = self._resolved_hosts.get(host)
+            if ip is None:
+                ip = self._resolved_hosts[host] = socket.gethostbyname(host)
+            pc = paramiko.SSHClient()
+            pc.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+            for attempt in range(4):
+                try:
+                    # 0.2 s was too tight for a full TCP + key exchange + auth
+                    # sequence and intermittently aborted against healthy
+                    # sshd-s, forcing pointless retries.
+                    pc.connect(ip, look_for_keys=True, timeout=5,
+                               banner_timeout=3, auth_timeout=5)
+                    break
+                except (paramiko.SSHException, socket.error) as e:
+                    if attempt == 3:
+                        pc.close()
+                        raise
+                    # sshd tarpits connections beyond MaxStartups; back off
+                    # exponentially instead of failing the launch outright.
+                    self.warning("Failed to connect to %s (attempt %d): %s",
+                                 host, attempt + 1, e)
+                    time.sleep(0.05 * (1 << attempt))
+            # Keep the pooled transport alive between launch bursts and do
+            # not let Nagle delay the short exec requests.
+            transport = pc.get_transport()
+            transport.set_keepalive(30)
+            transport.sock.setsockopt(
+                socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            with self._ssh_pool_lock:
+                self._ssh_pool[host] = pc
+            return pc
+
+    def _close_ssh_pool(self):
+        with self._ssh_pool_lock:
+            for pc in self._ssh_pool.values():
+                pc.close()
+            self._ssh_pool.clear()
 
     @threadsafe
     def _pre_run(self):
@@ -675,7 +872,14 @@ class Launcher(logger.Logger):
                 self.workflow.stopped = False
                 self.workflow.thread_pool.start()
                 self.workflow.thread_pool.callInThread(self.workflow.run)
-            reactor.callWhenRunning(run_workflow)
+            if self.is_standalone and not self.interactive:
+                # Starting the thread pool and enqueueing the run do not need
+                # a live reactor, so skip the callWhenRunning bounce - the
+                # reactor is started right after _pre_run() anyway and the
+                # workflow begins without waiting for its first iteration.
+                run_workflow()
+            else:
+                reactor.callWhenRunning(run_workflow)
         self.event("work", "begin", height=0.1)
 
     def _on_stop(self):
@@ -693,6 +897,7 @@ class Launcher(logger.Logger):
         self._running = False
         # Wait for the own graphics client to terminate normally
         self._stop_graphics()
+        self._close_ssh_pool()
         if not self.is_standalone:
             self.agent.close()
         self.workflow.thread_pool.shutdown()
@@ -788,19 +993,43 @@ class Launcher(logger.Logger):
     def _launch_status(self):
         if not self.reports_web_status:
             return
-        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        result = sock.connect_ex((root.common.web.host,
-                                  root.common.web.port))
-        sock.close()
+        # The TCP probe can stall for the full system connect timeout if the
+        # status host is firewalled, so bound it and run it on the reactor's
+        # thread pool to keep the startup path responsive.
+        d = threads.deferToThreadPool(
+            reactor, reactor.getThreadPool(), self._probe_and_launch_status)
+        d.addErrback(lambda error: self.warning(
+            "Failed to launch the web status server: %s", error))
+        return d
+
+    def _probe_and_launch_status(self):
+        # Resolve the status host once; otherwise getaddrinfo() runs inside
+        # every probe when the configured host is a name.
+        if Launcher._web_status_addr is None:
+            Launcher._web_status_addr = (
+                socket.gethostbyname(root.common.web.host),
+                root.common.web.port)
+        try:
+            sock = socket.create_connection(Launcher._web_status_addr,
+                                            timeout=0.2)
+        except socket.error:
+            result = -1
+        else:
+            sock.close()
+            result = 0
         if result != 0:
+            # The command line only depends on the configuration, so build it
+            # on the first probe and remember it (lazily, because the config
+            # may be overridden after this module is imported).
+            if Launcher._web_status_cmdline is None:
+                Launcher._web_status_cmdline = "PYTHONPATH=%s %s 2>>%s" % (
+                    os.path.dirname(root.common.dirs.veles),
+                    os.path.join(root.common.dirs.veles, "web_status.py"),
+                    "%s.stderr%s" %
+                    os.path.splitext(root.common.web.log_file))
             self.info("Launching the web status server")
             self.launch_remote_progs(
-                root.common.web.host,
-                "PYTHONPATH=%s %s 2>>%s" %
-                (os.path.dirname(root.common.dirs.veles),
-                 os.path.join(root.common.dirs.veles, "web_status.py"),
-                 "%s.stderr%s" %
-                 os.path.splitext(root.common.web.log_file)))
+                root.common.web.host, Launcher._web_status_cmdline)
         else:
             self.info("Web status server %s:%d is already running",
                       root.common.web.host, root.common.web.port)
@@ -816,30 +1045,40 @@ class Launcher(logger.Logger):
             "-a", "--backend", "-d", "--device", "--slave-launch-transform",
             "--result-file", "--pdb-on-finish", "--respawn",
             "--job-timeout")[1:]
-        host = self.args.listen_address[:self.args.listen_address.index(':')]
-        port = self.args.listen_address[len(host) + 1:]
+        host = self._listen_host
+        port = self._listen_port
         # No way we can send 'localhost' or empty host name to a slave.
         if not host or host in ("0.0.0.0", "localhost", "127.0.0.1"):
-            host = socket.gethostname()
-        filtered_argv.insert(0, "-m %s:%s -b -i \"%s\"" %
-                             (host, port, self.log_id))
-        slave_args = " ".join(filtered_argv)
+            host = self._local_hostname
+        # Quote every forwarded argument: paths with spaces or quotes would
+        # otherwise be torn apart by the remote shell, launching slaves with
+        # wrong arguments.
+        slave_args = " ".join(
+            ["-m %s:%s -b -i %s" % (host, port, shlex_quote(self.log_id))] +
+            [shlex_quote(arg) for arg in filtered_argv])
         self.debug("Slave args: %s", slave_args)
         total_slaves = 0
         max_slaves = self.args.max_nodes or 1000
-        cmdline = "%s %s" % (sys.executable, os.path.abspath(sys.argv[0])) + \
+        cmdline = "%s %s" % (sys.executable, _SELF_PATH) + \
             " --backend %s --device %s " + slave_args
         if self.args.log_file:
             cmdline += " &>> " + self.args.log_file
+        # Dispatch the SSH sessions concurrently on the reactor's thread pool,
+        # so N slaves come up in ~max(handshake latency) instead of the sum.
+        semaphore = DeferredSemaphore(self.SSH_FANOUT_LIMIT)
+        launches = []
         for node in self.slaves:
             host, devs = node.split('/')
             progs = [cmdline % dev for dev in Device.iterparse(devs)]
             if total_slaves + len(progs) > max_slaves:
                 progs = progs[:max_slaves - total_slaves]
             total_slaves += len(progs)
-            self.launch_remote_progs(host, *progs)
+            launches.append(semaphore.run(
+                threads.deferToThreadPool, reactor, reactor.getThreadPool(),
+                self.launch_remote_progs, host, *progs))
             if total_slaves >= max_slaves:
                 break
+        return DeferredList(launches)
 
     def _set_webagg_port(self, port):
         self.info("Found out the WebAgg port: %d", port)
@@ -863,24 +1102,22 @@ class Launcher(logger.Logger):
         ret = {'id': self.id,
                'log_id': self.log_id,
                'name': self.workflow.name,
-               'master': socket.gethostname(),
+               'master': self._local_hostname,
                'time': "%02d:%02d:%02d" % (hours, mins, secs),
                'user': getpass.getuser(),
                'graph': self.workflow_graph,
                'log_addr': self.mongo_log_addr,
                'slaves': self._agent.nodes if self.is_master else [],
-               'plots': "http://%s:%d" % (socket.gethostname(),
+               'plots': "http://%s:%d" % (self._local_hostname,
                                           self.webagg_port),
                'custom_plots': "<br/>".join(self.plots_endpoints),
                'description':
                "<br />".join(escape(self.workflow.__doc__ or "").split("\n"))}
-        url = "http://%s:%d/update" % (root.common.web.host,
-                                       root.common.web.port)
-        headers = Headers({b'User-Agent': [b'twisted']})
         body = FileBodyProducer(BytesIO(json.dumps(ret).encode('charmap')))
-        self.debug("Uploading status update to %s", url)
+        self.debug("Uploading status update to %s", self._notify_url)
         d = self._web_status_agent.request(
-            b'POST', url.encode('ascii'), headers=headers, bodyProducer=body)
+            b'POST', self._notify_url, headers=self._notify_headers,
+            bodyProducer=body)
         d.addCallback(self._notify_status)
         d.addErrback(self._on_notify_status_error)
 